@@ -20,8 +20,18 @@ import errno
 import json
 import os.path
 import re
+import sys
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+# orjson is an optional dependency that speeds up writing and reading the
+# intermediate map files; the standard json module is used when it's not
+# installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Various globals mapping symbolic names to the object/function names in
 # the supporting C++ library. This is done so that changes in namespaces don't
@@ -41,6 +51,263 @@ UNPACK_FN = "BufferUtils::unpack"
 
 GENERATED_CODE_NAMESPACE = "GeneratedFunctions"
 
+# C++ skeletons for the code generated per NANO_LOG statement. They're filled
+# in with str.format() by FunctionGenerator.generateLogFunctions().
+
+# Record function injected into the user's sources in place of the NANO_LOG
+RECORD_FN_TEMPLATE = """
+inline {function_declaration} {{
+    extern const uint32_t {idVariableName};
+
+    if (level > {getLogLevelFn}())
+        return;
+
+    uint64_t timestamp = PerfUtils::Cycles::rdtsc();
+    {strlen_declaration};
+    size_t allocSize = {primitive_size_sum} {strlen_sum} sizeof({entry});
+    {entry} *re = reinterpret_cast<{entry}*>({alloc_fn}(allocSize));
+
+    re->fmtId = {idVariableName};
+    re->timestamp = timestamp;
+    re->entrySize = static_cast<uint32_t>(allocSize);
+
+    char *buffer = re->argData;
+
+    // Record the non-string arguments
+    {recordNonStringArgsCode}
+
+    // Record the strings (if any) at the end of the entry
+    {recordStringsArgsCode}
+
+    // Make the entry visible
+    {finishAlloc_fn}(allocSize);
+}}
+"""
+
+# Compresses the arguments recorded by the record function into an output
+# buffer. Note that the compression runtime code should have handled the
+# metadata, so the template doesn't deal with it.
+COMPRESS_FN_TEMPLATE = """
+inline ssize_t
+{compressFnName}({Entry} *re, char* out) {{
+    char *originalOutPtr = out;
+
+    // Allocate nibbles
+    {Nibble} *nib = reinterpret_cast<{Nibble}*>(out);
+    out += {nibbleBytes};
+
+    char *args = re->argData;
+
+    // Read back all the primitives
+    {readBackNonStringArgsCode}
+
+    // Pack all the primitives
+    {packNonStringArgsCode}
+
+    if ({hasStrings}) {{
+        // memcpy all the strings without compression
+        size_t stringBytes = re->entrySize - ({sizeofNonStringTypes} 0)
+                                            - sizeof({Entry});
+        if (stringBytes > 0) {{
+            memcpy(out, args, stringBytes);
+            out += stringBytes;
+        }}
+    }}
+
+    return out - originalOutPtr;
+}}
+"""
+
+# Decompresses the arguments generated by the compression function and prints
+# them (or passes them to an aggregation function).
+DECOMPRESS_FN_TEMPLATE = """
+inline void
+{decompressFnName} (const char **in,
+                        FILE *outputFd,
+                        void (*aggFn)(const char*, ...)) {{
+    {Nibble} nib[{nibbleBytes}];
+    memcpy(&nib, (*in), {nibbleBytes});
+    (*in) += {nibbleBytes};
+
+    // Unpack all the non-string argments
+    {unpackNonStringArgsCode}
+
+    // Find all the strings
+    {readbackStringCode}
+
+    const char *fmtString = "{fmtString}";
+    const char *filename = "{filename}";
+    const int linenum = {linenum};
+    const {logLevelEnum} logLevel = {logLevel};
+
+    if (outputFd)
+        fprintf(outputFd, "{fmtString}" "\\r\\n" {printfArgs});
+
+    if (aggFn)
+        (*aggFn)("{fmtString}" {printfArgs});
+}}
+"""
+
+# Header for the dictionary entry describing a NANO_LOG statement. It's followed
+# by one PRINT_FRAGMENT_TEMPLATE per format specifier and a closing brace.
+DICTIONARY_FRAGMENT_TEMPLATE = """
+{{
+    // {filename}:{linenum} - "{fmtString}"
+    FormatMetadata *fm;
+    PrintFragment *pf;
+    if (buffer + sizeof(FormatMetadata) + {filenameLength} >= endOfBuffer)
+        return -1;
+
+    fm = reinterpret_cast<FormatMetadata*>(buffer);
+    buffer += sizeof(FormatMetadata);
+
+    fm->numNibbles = {numNibbles};
+    fm->numPrintFragments = {numPrintFragments};
+    fm->logLevel = {logLevel};
+    fm->lineNumber = {linenum};
+    fm->filenameLength = {filenameLength};
+
+    buffer = stpcpy(buffer, "{filename}") + 1;
+"""
+
+# Dictionary entry for a single format specifier in a NANO_LOG format string
+PRINT_FRAGMENT_TEMPLATE = """
+            // Fragment {count}
+            if (buffer + sizeof(PrintFragment)
+                        + sizeof("{substring}")/sizeof(char) >= endOfBuffer)
+                return -1;
+
+            pf = reinterpret_cast<PrintFragment*>(buffer);
+            buffer += sizeof(PrintFragment);
+
+            pf->argType = {type};
+            pf->hasDynamicWidth = {width};
+            pf->hasDynamicPrecision = {precision};
+            pf->fragmentLength = sizeof("{substring}")/sizeof(char);
+
+            buffer = stpcpy(buffer, "{substring}") + 1;
+"""
+
+# The C++ header combining the code generated for all the NANO_LOG statements,
+# as emitted by FunctionGenerator.outputCompilationFiles(). The function
+# definitions and id assignments are the concatenation of the per-statement
+# pieces, while the list* fields are comma separated array initializers.
+COMPILATION_FILE_TEMPLATE = """
+#ifndef BUFFER_STUFFER
+#define BUFFER_STUFFER
+
+#include "NanoLog.h"
+#include "Packer.h"
+
+#include <string>
+
+// Since some of the functions/variables output below are for debugging purposes
+// only (i.e. they're not used in their current form), squash all gcc complaints
+// about unused variables/functions.
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wunused-function"
+#pragma GCC diagnostic ignored "-Wunused-variable"
+
+/**
+ * Describes a log message found in the user sources by the original format
+ * string provided, the file where the log message occurred, and the line number
+ */
+struct LogMetadata {{
+  const char *fmtString;
+  const char *fileName;
+  uint32_t lineNumber;
+  {logLevelEnum} logLevel;
+}};
+
+// Start an empty namespace to enclose all the record(debug)/compress/decompress
+// and support functions
+namespace {{
+
+using namespace NanoLog::LogLevels;
+{functionDefinitions}
+}} // end empty namespace
+
+// Assignment of numerical ids to format NANO_LOG occurrences
+{idAssignments}
+// Start new namespace for generated ids and code
+namespace {namespace} {{
+
+// Map of numerical ids to log message metadata
+struct LogMetadata logId2Metadata[{count}] =
+{{
+    {listOfLogId2Metadata}
+}};
+
+// Map of numerical ids to compression functions
+ssize_t
+(*compressFnArray[{count}]) ({Entry} *re, char* out)
+{{
+    {listOfCompressFnNames}
+}};
+
+// Map of numerical ids to decompression functions
+void
+(*decompressAndPrintFnArray[{count}]) (const char **in,
+                                        FILE *outputFd,
+                                        void (*aggFn)(const char*, ...))
+{{
+    {listOfDecompressionFnNames}
+}};
+
+// Writes the metadata needed by the decompressor to interpret the log messages
+// generated by compressFn.
+long int writeDictionary(char *buffer, char *endOfBuffer) {{
+    using namespace NanoLogInternal::Log;
+    char *startPos = buffer;
+    {combinedDictionaryFragments}
+    return buffer - startPos;
+}}
+
+// Total number of logIds. Can be used to bounds check array accesses.
+size_t numLogIds = {count};
+
+// Pop the unused gcc warnings
+#pragma GCC diagnostic pop
+
+}}; // {namespace}
+
+#endif /* BUFFER_STUFFER */
+"""
+
+# Reads an intermediate map file produced by outputMappingFile() and returns
+# the two portions needed to produce the final compilation files.
+#
+# \param filename
+#           Path of the intermediate map file to read
+#
+# \return
+#           (logId2Code, signature2Template) dictionaries of the map file
+#
+# \throws ValueError
+#           Thrown if the map file was generated by an older, incompatible
+#           version of the preprocessor
+def loadMappingFile(filename):
+    if orjson:
+        with open(filename, 'rb') as iFile:
+            loaded_json = orjson.loads(iFile.read())
+    else:
+        with open(filename, 'r') as iFile:
+            loaded_json = json.load(iFile)
+
+    # Map files written by older versions of the preprocessor store complete
+    # functions per log statement instead of templates shared per signature.
+    # Every map contains the invalid sentinel entry, so its fields are enough
+    # to tell the formats apart.
+    sentinel = loaded_json["logId2Code"].get("__INVALID__INVALID__INVALID__",
+                                             {})
+    if "signature2Template" not in loaded_json or \
+            "signature" not in sentinel or "idVariableName" not in sentinel:
+        raise ValueError("Stale map file \"%s\" was generated by an older "
+                         "version of the NanoLog preprocessor; run "
+                         "\"make clean\" and rebuild" % filename)
+
+    return loaded_json["logId2Code"], loaded_json["signature2Template"]
+
 # This class assigns unique identifiers to unique printf-like format strings,
 # generates C++ code to record/compress/decompress the printf-like statements
 # in the NanoLog system, and maintains these mappings between multiple
@@ -92,11 +359,17 @@ class FunctionGenerator(object):
                     # preprocessor will inline the log statement.
                     "compilationUnit"   : "INVALID.cc",
 
-                    # Complete function definitions for recording, compressing
-                    # and decompressing a NANO_LOG statement
-                    "recordFnDef"       : "invalidRecord(int arg0) { ... }",
-                    "compressFnDef"     : "invalidCompress(...) { ....}",
-                    "decompressFnDef"   : "invalidDecompress(...) { ... }",
+                    # LogLevel the NANO_LOG statement was invoked with
+                    "logLevel"          : "INVALID",
+
+                    # Key into signature2Template for the templates of the
+                    # record, compress, and decompress function definitions
+                    "signature"         : "__INVALID__",
+
+                    # Name of the extern int that identifies the NANO_LOG
+                    # at runtime, as generated by
+                    # generateIdVariableNameFromLogId()
+                    "idVariableName"    : "__fmtId__INVALID__INVALID__INVALID__",
 
                     # Function names for the recording, compressing and
                     # decompressing functions above
@@ -113,9 +386,27 @@ class FunctionGenerator(object):
                 }
         }
 
+        # Map of the function definition templates shared by all NANO_LOG
+        # statements with the same argument signature. The complete definitions
+        # for a particular NANO_LOG statement are formed by filling in its
+        # logId2Code entry via fillFunctionTemplate(). Like logId2Code, it is
+        # pre-populated with an invalid entry to demonstrate its structure.
+        self.signature2Template = {
+            # The function parameters of the record function followed by the
+            # computations of the string argument lengths
+            "__INVALID__":
+                {
+                    # Templates of the function definitions for recording,
+                    # compressing and decompressing a NANO_LOG statement
+                    "recordFnDef"       : "invalidRecord(int arg0) { ... }",
+                    "compressFnDef"     : "invalidCompress(...) { ....}",
+                    "decompressFnDef"   : "invalidDecompress(...) { ... }"
+                }
+        }
+
         # Debug data structure that keeps track of the number of parameter
         # combinations (i.e. "%d %d") by mapping the format string to a counter
-        self.argLists2Cnt = {}
+        self.argLists2Cnt = defaultdict(int)
 
     # Output the internal state of the FunctionGenerator to a JSON file that
     # can later be aggregated to generate the C++ file that contains the
@@ -123,7 +414,12 @@ class FunctionGenerator(object):
     #
     # \param filename
     #           file to persist the state to
-    def outputMappingFile(self, filename):
+    #
+    # \param pretty
+    #           Indent and sort the JSON output for human consumption; the
+    #           default compact form is meant only to be read back by
+    #           outputCompilationFiles()
+    def outputMappingFile(self, filename, pretty=False):
         dirname = os.path.dirname(filename)
         if dirname and not os.path.exists(dirname):
             try:
@@ -132,167 +428,111 @@ class FunctionGenerator(object):
                 if exc.errno != errno.EEXIST:
                     raise
 
-        with open(filename, 'w') as json_file:
-            outputJSON = {
-                "argLists2Cnt":self.argLists2Cnt,
-                "logId2Code":self.logId2Code
-            }
-
-            json_file.write(json.dumps(outputJSON, sort_keys=True,
-                                            indent=4, separators=(',', ': ')))
-
-    # Output the C++ header needed by the runtime library to perform the log
-    # compression and decompression routines. The file shall contain the
-    # following data structures/code:
-    #       - Assignment of extern int's that uniquely id the log statements
-    #       - A function array mapping id's to compression functions
-    #       - A function array mapping id's to decompression functions
-    #       - The supporting compression/decompression functions
-    #       - The record function that should have been injected (for debugging)
-    #
-    # \param filename
-    #               The C++ file to emit
-    @staticmethod
-    def outputCompilationFiles(outputFileName="BufferStuffer.h", inputFiles=[]):
-        # Merge all the intermediate compilations
-        mergedCode = {}
-        for filename in inputFiles:
-            with open(filename, 'r') as iFile:
-                loaded_json = json.load(iFile)
-                mergedCode.update(loaded_json["logId2Code"])
-
-        # Output the C++ code. It may be a bit hard to read admist the static
-        # C++ code, but all the code immediately before/after a triple quote
-        # sections are in the same indention.
-        with open(outputFileName, 'w') as oFile:
-            oFile.write("""
-#ifndef BUFFER_STUFFER
-#define BUFFER_STUFFER
-
-#include "NanoLog.h"
-#include "Packer.h"
-
-#include <string>
-
-// Since some of the functions/variables output below are for debugging purposes
-// only (i.e. they're not used in their current form), squash all gcc complaints
-// about unused variables/functions.
-#pragma GCC diagnostic push
-#pragma GCC diagnostic ignored "-Wunused-function"
-#pragma GCC diagnostic ignored "-Wunused-variable"
-
-/**
- * Describes a log message found in the user sources by the original format
- * string provided, the file where the log message occurred, and the line number
- */
-struct LogMetadata {{
-  const char *fmtString;
-  const char *fileName;
-  uint32_t lineNumber;
-  {logLevelEnum} logLevel;
-}};
-
-// Start an empty namespace to enclose all the record(debug)/compress/decompress
-// and support functions
-namespace {{
-
-using namespace NanoLog::LogLevels;
-""".format(logLevelEnum=LOG_LEVEL_ENUM))
-            for logId, code in sorted(mergedCode.items()):
-                if logId == "__INVALID__INVALID__INVALID__":
-                    continue
-
-                oFile.write(code["recordFnDef"] + "\n")
-                oFile.write(code["compressFnDef"] + "\n")
-                oFile.write(code["decompressFnDef"] + "\n")
-
-            oFile.write("""
-} // end empty namespace
-
-// Assignment of numerical ids to format NANO_LOG occurrences
-""")
-
-            # Here, we take the iteration order as the canonical order
-            count = 0
-            logId2Metadata = []
-            compressFnNameArray = []
-            decompressFnNameArray = []
-            dictionaryFragments = []
-            for logId, code in sorted(mergedCode.items()):
-                if logId == "__INVALID__INVALID__INVALID__":
-                    continue
-
-                dictionaryFragments.append(code['dictionaryFragment'])
-                logId2Metadata.append("{\"%s\", \"%s\", %d, %s}" % (
-                    code["fmtString"],
-                    code["filename"],
-                    code["linenum"],
-                    code["logLevel"]
-                ))
-
-                oFile.write("extern const int %s = %d; // %s:%d \"%s\"\n" % (
-                        generateIdVariableNameFromLogId(logId),
-                        count,
-                        code["filename"],
-                        code["linenum"],
-                        code["fmtString"]
-                ))
-                count += 1
-
-                compressFnNameArray.append(code["compressFnName"])
-                decompressFnNameArray.append(code["decompressFnName"])
-            oFile.write("""
-// Start new namespace for generated ids and code
-namespace {namespace} {{
-
-// Map of numerical ids to log message metadata
-struct LogMetadata logId2Metadata[{count}] =
-{{
-    {listOfLogId2Metadata}
-}};
-
-// Map of numerical ids to compression functions
-ssize_t
-(*compressFnArray[{count}]) ({Entry} *re, char* out)
-{{
-    {listOfCompressFnNames}
-}};
-
-// Map of numerical ids to decompression functions
-void
-(*decompressAndPrintFnArray[{count}]) (const char **in,
-                                        FILE *outputFd,
-                                        void (*aggFn)(const char*, ...))
-{{
-    {listOfDecompressionFnNames}
-}};
-
-// Writes the metadata needed by the decompressor to interpret the log messages
-// generated by compressFn.
-long int writeDictionary(char *buffer, char *endOfBuffer) {{
-    using namespace NanoLogInternal::Log;
-    char *startPos = buffer;
-    {combinedDictionaryFragments}
-    return buffer - startPos;
-}}
+        outputJSON = {
+            "argLists2Cnt":self.argLists2Cnt,
+            "logId2Code":self.logId2Code,
+            "signature2Template":self.signature2Template
+        }
 
-// Total number of logIds. Can be used to bounds check array accesses.
-size_t numLogIds = {count};
+        if orjson:
+            option = 0
+            if pretty:
+                option = orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2
 
-// Pop the unused gcc warnings
-#pragma GCC diagnostic pop
+            with open(filename, 'wb') as json_file:
+                json_file.write(orjson.dumps(outputJSON, option=option))
+        else:
+            if pretty:
+                output = json.dumps(outputJSON, sort_keys=True, indent=4,
+                                    separators=(',', ': '))
+            else:
+                output = json.dumps(outputJSON, separators=(',', ':'))
 
-}}; // {namespace}
+            with open(filename, 'w') as json_file:
+                json_file.write(output)
 
-#endif /* BUFFER_STUFFER */
-""".format(count=count,
-           Entry=RECORD_ENTRY,
-           listOfLogId2Metadata=",\n".join(logId2Metadata),
-           listOfCompressFnNames=",\n".join(compressFnNameArray),
-           listOfDecompressionFnNames=",\n".join(decompressFnNameArray),
-           combinedDictionaryFragments="\n\n".join(dictionaryFragments),
-           namespace=GENERATED_CODE_NAMESPACE
-))
+    # Output the C++ header needed by the runtime library to perform the log
+    # compression and decompression routines. The file shall contain the
+    # following data structures/code:
+    #       - Assignment of extern int's that uniquely id the log statements
+    #       - A function array mapping id's to compression functions
+    #       - A function array mapping id's to decompression functions
+    #       - The supporting compression/decompression functions
+    #       - The record function that should have been injected (for debugging)
+    #
+    # \param filename
+    #               The C++ file to emit
+    @staticmethod
+    def outputCompilationFiles(outputFileName="BufferStuffer.h", inputFiles=[]):
+        # Merge all the intermediate compilations. The argLists2Cnt portion
+        # of each map is not needed (see loadMappingFile()), and the first
+        # map's dictionaries are adopted as is rather than being re-inserted
+        # entry by entry into empty ones.
+        mergedCode = {}
+        mergedTemplates = {}
+        for filename in inputFiles:
+            logId2Code, signature2Template = loadMappingFile(filename)
+            if mergedCode:
+                mergedCode.update(logId2Code)
+                mergedTemplates.update(signature2Template)
+            else:
+                mergedCode = logId2Code
+                mergedTemplates = signature2Template
+
+        # Here, we take the iteration order as the canonical order and collect
+        # all the per-log pieces in a single pass over the merged code
+        count = 0
+        functionDefinitions = []
+        idAssignments = []
+        logId2Metadata = []
+        compressFnNameArray = []
+        decompressFnNameArray = []
+        dictionaryFragments = []
+        for logId, code in sorted(mergedCode.items()):
+            if logId == "__INVALID__INVALID__INVALID__":
+                continue
+
+            templates = mergedTemplates[code["signature"]]
+            functionDefinitions.append(fillFunctionTemplate(
+                            templates["recordFnDef"], logId, code) + "\n")
+            functionDefinitions.append(fillFunctionTemplate(
+                            templates["compressFnDef"], logId, code) + "\n")
+            functionDefinitions.append(fillFunctionTemplate(
+                            templates["decompressFnDef"], logId, code) + "\n")
+
+            dictionaryFragments.append(code['dictionaryFragment'])
+            logId2Metadata.append("{\"%s\", \"%s\", %d, %s}" % (
+                code["fmtString"],
+                code["filename"],
+                code["linenum"],
+                code["logLevel"]
+            ))
+
+            idAssignments.append("extern const int %s = %d; // %s:%d \"%s\"\n" % (
+                    code["idVariableName"],
+                    count,
+                    code["filename"],
+                    code["linenum"],
+                    code["fmtString"]
+            ))
+            count += 1
+
+            compressFnNameArray.append(code["compressFnName"])
+            decompressFnNameArray.append(code["decompressFnName"])
+
+        with open(outputFileName, 'w') as oFile:
+            oFile.write(COMPILATION_FILE_TEMPLATE.format(
+                logLevelEnum=LOG_LEVEL_ENUM,
+                functionDefinitions="".join(functionDefinitions),
+                idAssignments="".join(idAssignments),
+                count=count,
+                Entry=RECORD_ENTRY,
+                listOfLogId2Metadata=",\n".join(logId2Metadata),
+                listOfCompressFnNames=",\n".join(compressFnNameArray),
+                listOfDecompressionFnNames=",\n".join(decompressFnNameArray),
+                combinedDictionaryFragments="\n\n".join(dictionaryFragments),
+                namespace=GENERATED_CODE_NAMESPACE
+            ))
 
     # Given a compilation unit via filename, return all the record functions
     # that were generated for that file.
@@ -308,7 +548,9 @@ size_t numLogIds = {count};
 
         for logId, code in sorted(self.logId2Code.items()):
             if code["compilationUnit"] == compilationUnit:
-                recordFns.append(code["recordFnDef"])
+                template = self.signature2Template[code["signature"]]
+                recordFns.append(fillFunctionTemplate(template["recordFnDef"],
+                                                      logId, code))
 
         return recordFns
 
@@ -354,66 +596,37 @@ size_t numLogIds = {count};
         fmtSpecifiers = splitAndParseTypesInFmtString(fmtString)
 
         # Build a list of argument types that the printf-function
-        # corresponding to the format string would actually take in.
+        # corresponding to the format string would actually take in along
+        # with the code to compute the length of each string argument.
         argList = []
-        for fmtSpecifier in fmtSpecifiers:
-            if not fmtSpecifier.type:
+        strlenDeclarations = []
+        numNibbles = 0
+        for (type, width, precision, substring) in fmtSpecifiers:
+            if not type:
                 continue
 
             # In addition to the parameter for the specifier, variable
             # variable width/preicsion requires extra parameters.
-            if fmtSpecifier.width == '*':
-                argList.append("int")
-
-            if fmtSpecifier.precision == '*':
+            if width == '*':
                 argList.append("int")
-
-            argList.append(fmtSpecifier.type)
-
-        functionParametersString = "".join([", %s arg%d" % (type, idx)
-                                          for idx, type in enumerate(argList)])
-
-        recordFnName = "__syang0__fl" + logId
-        recordDeclaration = "void %s(%s level, const char* fmtStr %s)" % (
-                    recordFnName, LOG_LEVEL_ENUM, functionParametersString)
-
-        # Keep track of instance metrics
-        if functionParametersString in self.argLists2Cnt:
-            self.argLists2Cnt[functionParametersString] += 1
-        else:
-            self.argLists2Cnt[functionParametersString] = 1
-
-
-        ###
-        # Generate Record function
-        ###
-
-        # Create lists identifying which argument indexes are (not) strings
-        stringArgsIdx = [idx for idx, fmt in enumerate(argList)
-                                                if isStringType(fmt)]
-        nonStringArgsIdx = [idx for idx, fmt in enumerate(argList)
-                                                if idx not in stringArgsIdx]
-
-        # Create more usable strings for each list
-        strlenDeclarations = []
-        argNum = 0
-        for fmtSpecifier in fmtSpecifiers:
-            precision = fmtSpecifier.precision
+                numNibbles += 1
 
             if precision == '*':
-                argNum += 1
+                argList.append("int")
+                numNibbles += 1
 
-            if fmtSpecifier.width == '*':
-                argNum += 1
+            argNum = len(argList)
+            argList.append(type)
 
-            if not isStringType(fmtSpecifier.type):
-                argNum += 1
+            if not isStringType(type):
+                # Non-string arguments are each encoded with a nibble
+                numNibbles += 1
                 continue
 
             strlenToAdd = "size_t str{0}Len = ".format(argNum)
 
             # The +1's below are for the NULL character
-            if isWideString(fmtSpecifier.type):
+            if isWideString(type):
                 if not precision:
                     strlenToAdd += "(1 + wcslen(arg{0}))*sizeof(wchar_t);"\
                                         .format(argNum)
@@ -434,227 +647,47 @@ size_t numLogIds = {count};
                                                                      precision)
             strlenDeclarations.append(strlenToAdd)
 
-            argNum += 1
-
-        # For these two partial sums, it must end in a '+' character. Also,
-        # for stringLenPartialSum, there's a +1 for a NULL character at the end
-        stringLenPartialSum = "".join(["str%dLen + " % (idx)
-                                      for idx in stringArgsIdx])
-
-        nonStringSizeOfPartialSum = "".join(["sizeof(arg%d) + " % idx
-                                          for idx in nonStringArgsIdx])
-
-        # Bytes needed to store the primitive byte lengths
-        numNibbles = len(nonStringArgsIdx)
-        nibbleByteSizes = int(( numNibbles + 1)/2)
-
-        recordNonStringArgsCode = "".join(["\t%s(buffer, arg%d);\n" % \
-                (RECORD_PRIMITIVE_FN, idx) for idx in nonStringArgsIdx])
-
-        recordStringsArgsCode = ["memcpy(buffer, arg{0}, str{0}Len); "
-               "buffer += str{0}Len;"
-               "*(reinterpret_cast<std::remove_const<typename std::remove_pointer<decltype(arg{0})>::type>::type*>(buffer) - 1) = L'\\0';".format(
-                                               idx) for idx in stringArgsIdx]
-
-        # Start Generating the record code
-        recordCode = \
-"""
-inline {function_declaration} {{
-    extern const uint32_t {idVariableName};
-
-    if (level > {getLogLevelFn}())
-        return;
-
-    uint64_t timestamp = PerfUtils::Cycles::rdtsc();
-    {strlen_declaration};
-    size_t allocSize = {primitive_size_sum} {strlen_sum} sizeof({entry});
-    {entry} *re = reinterpret_cast<{entry}*>({alloc_fn}(allocSize));
-
-    re->fmtId = {idVariableName};
-    re->timestamp = timestamp;
-    re->entrySize = static_cast<uint32_t>(allocSize);
-
-    char *buffer = re->argData;
+        functionParametersString = "".join([f", {type} arg{idx}"
+                                          for idx, type in enumerate(argList)])
 
-    // Record the non-string arguments
-    {recordNonStringArgsCode}
+        recordFnName = "__syang0__fl" + logId
+        recordDeclaration = "void %s(%s level, const char* fmtStr %s)" % (
+                    recordFnName, LOG_LEVEL_ENUM, functionParametersString)
 
-    // Record the strings (if any) at the end of the entry
-    {recordStringsArgsCode}
+        # Keep track of instance metrics
+        self.argLists2Cnt[functionParametersString] += 1
 
-    // Make the entry visible
-    {finishAlloc_fn}(allocSize);
-}}
-""".format(function_declaration = recordDeclaration,
-       getLogLevelFn=LOG_LEVEL_GET_FN,
-       strlen_declaration = "\r\n\t".join(strlenDeclarations),
-       primitive_size_sum = nonStringSizeOfPartialSum,
-       strlen_sum = stringLenPartialSum,
-       entry = RECORD_ENTRY,
-       alloc_fn = ALLOC_FN,
-       idVariableName = generateIdVariableNameFromLogId(logId),
-       nibble_size = nibbleByteSizes,
-       recordNonStringArgsCode = recordNonStringArgsCode,
-       recordStringsArgsCode = "\r\n\t".join(recordStringsArgsCode),
-       finishAlloc_fn = FINISH_ALLOC_FN
-)
 
         ###
-        # Generate compression
+        # Generate the record, compress, and decompress functions
         ###
 
-        # Generate code to compress the arguments from a RecordEntry to
-        # an output array. Note that the compression runtime code should have
-        # handled the metadata, so we don't have to worry about that here
-
-        readBackNonStringArgsCode = ""
-        for idx in nonStringArgsIdx:
-            readBackNonStringArgsCode += \
-                    "\t{type} arg{id}; " \
-                    "std::memcpy(&arg{id}, args, sizeof({type})); " \
-                "args +=sizeof({type});\n".format(type=argList[idx], id=idx)
-
-        packNonStringArgsCode = ""
-        for i, idx in enumerate(nonStringArgsIdx):
-            mem = "first" if (i % 2 == 0) else "second"
-            arrIndex = i / 2
-            packNonStringArgsCode += \
-                "\tnib[%d].%s = 0x0f & static_cast<uint8_t>(%s(&out, arg%d));\n" \
-                    % (arrIndex, mem, PACK_FN, idx)
+        # NANO_LOG statements that take in the same arguments only differ in
+        # the statement specific parts of their generated functions (i.e. the
+        # logId, format string, filename, line number, and log level), so the
+        # functions are generated once per signature as templates that are
+        # filled in later with fillFunctionTemplate().
+        signature = functionParametersString + " " + " ".join(strlenDeclarations)
+        if signature not in self.signature2Template:
+            self.signature2Template[signature] = generateFunctionTemplates(
+                                                    argList, strlenDeclarations)
 
         compressFnName = "compressArgs" + logId
-        compressionCode = \
-"""
-inline ssize_t
-{compressFnName}({Entry} *re, char* out) {{
-    char *originalOutPtr = out;
-
-    // Allocate nibbles
-    {Nibble} *nib = reinterpret_cast<{Nibble}*>(out);
-    out += {nibbleBytes};
-
-    char *args = re->argData;
-
-    // Read back all the primitives
-    {readBackNonStringArgsCode}
-
-    // Pack all the primitives
-    {packNonStringArgsCode}
-
-    if ({hasStrings}) {{
-        // memcpy all the strings without compression
-        size_t stringBytes = re->entrySize - ({sizeofNonStringTypes} 0)
-                                            - sizeof({Entry});
-        if (stringBytes > 0) {{
-            memcpy(out, args, stringBytes);
-            out += stringBytes;
-        }}
-    }}
-
-    return out - originalOutPtr;
-}}
-""".format(compressFnName=compressFnName,
-        Entry=RECORD_ENTRY,
-        Nibble=NIBBLE_OBJ,
-        nibbleBytes=nibbleByteSizes,
-        readBackNonStringArgsCode=readBackNonStringArgsCode,
-        packNonStringArgsCode=packNonStringArgsCode,
-        sizeofNonStringTypes=nonStringSizeOfPartialSum,
-        hasStrings=("true" if stringArgsIdx else "false")
-)
+        decompressFnName = "decompressPrintArgs" + logId
 
         ###
-        # Generate Decompression
+        # Generate the dictionary entry for the decompressor
         ###
 
-        # Unpack all the non-string arguments with their nibbles
-        unpackNonStringArgsCode = ""
-        for i, idx in enumerate(nonStringArgsIdx):
-            type = argList[idx]
-            member = "first" if (i%2 == 0) else "second"
-
-            unpackNonStringArgsCode += "\t%s arg%d = %s<%s>(in, nib[%d].%s);\n" % (
-                                        type, idx, UNPACK_FN, type, i/2, member)
-
-        # Read back all the strings
-        readbackStringCode = ""
-        for idx in stringArgsIdx:
-            type = argList[idx]
-
-            strlenFn = "strlen" if not isWideString(type) else "wcslen"
-            readbackStringCode += \
-            """
-                {type} arg{idx} = reinterpret_cast<{type}>(*in);
-                (*in) += ({strlenFn}(arg{idx}) + 1)*sizeof(*arg{idx}); // +1 for null terminator
-            """.format(idx=idx, type=type, strlenFn=strlenFn)
-
-
-        decompressFnName = "decompressPrintArgs" + logId
-        decompressionCode = \
-"""
-inline void
-{decompressFnName} (const char **in,
-                        FILE *outputFd,
-                        void (*aggFn)(const char*, ...)) {{
-    {Nibble} nib[{nibbleBytes}];
-    memcpy(&nib, (*in), {nibbleBytes});
-    (*in) += {nibbleBytes};
-
-    // Unpack all the non-string argments
-    {unpackNonStringArgsCode}
-
-    // Find all the strings
-    {readbackStringCode}
-
-    const char *fmtString = "{fmtString}";
-    const char *filename = "{filename}";
-    const int linenum = {linenum};
-    const {logLevelEnum} logLevel = {logLevel};
-
-    if (outputFd)
-        fprintf(outputFd, "{fmtString}" "\\r\\n" {printfArgs});
-
-    if (aggFn)
-        (*aggFn)("{fmtString}" {printfArgs});
-}}
-""".format(decompressFnName=decompressFnName,
-        Nibble=NIBBLE_OBJ,
-        nibbleBytes=nibbleByteSizes,
-        unpackNonStringArgsCode=unpackNonStringArgsCode,
-        readbackStringCode=readbackStringCode,
-        fmtString=fmtString,
-        filename=filename,
-        linenum=linenum,
-        logLevelEnum=LOG_LEVEL_ENUM,
-        logLevel=logLevel,
-        printfArgs="".join([", arg%d" % i for i, type in enumerate(argList)])
-)
-        dictionaryFragment = """
-{{
-    // {filename}:{linenum} - "{fmtString}"
-    FormatMetadata *fm;
-    PrintFragment *pf;
-    if (buffer + sizeof(FormatMetadata) + {filenameLength} >= endOfBuffer)
-        return -1;
-
-    fm = reinterpret_cast<FormatMetadata*>(buffer);
-    buffer += sizeof(FormatMetadata);
-
-    fm->numNibbles = {numNibbles};
-    fm->numPrintFragments = {numPrintFragments};
-    fm->logLevel = {logLevel};
-    fm->lineNumber = {linenum};
-    fm->filenameLength = {filenameLength};
-
-    buffer = stpcpy(buffer, "{filename}") + 1;
-""".format(numNibbles=numNibbles,
-           numPrintFragments=len(fmtSpecifiers),
-           logLevel=logLevel,
-           linenum=linenum,
-           filenameLength=len(filename) + 1,
-           filename=filename,
-           fmtString=fmtString
-           )
+        dictionaryFragment = [DICTIONARY_FRAGMENT_TEMPLATE.format(
+            numNibbles=numNibbles,
+            numPrintFragments=len(fmtSpecifiers),
+            logLevel=logLevel,
+            linenum=linenum,
+            filenameLength=len(filename) + 1,
+            filename=filename,
+            fmtString=fmtString
+        )]
 
         count = 0
         for (type, width, precision, substring) in fmtSpecifiers:
@@ -664,30 +697,16 @@ inline void
             else:
                 enumType = "NONE"
 
-            dictionaryFragment += """
-            // Fragment {count}
-            if (buffer + sizeof(PrintFragment)
-                        + sizeof("{substring}")/sizeof(char) >= endOfBuffer)
-                return -1;
-
-            pf = reinterpret_cast<PrintFragment*>(buffer);
-            buffer += sizeof(PrintFragment);
-
-            pf->argType = {type};
-            pf->hasDynamicWidth = {width};
-            pf->hasDynamicPrecision = {precision};
-            pf->fragmentLength = sizeof("{substring}")/sizeof(char);
-
-            buffer = stpcpy(buffer, "{substring}") + 1;
-""".format(count=count,
-           type=enumType,
-           width="true" if width == '*' else "false",
-           precision="true" if precision == '*' else "false",
-           substring=substring
-            )
+            dictionaryFragment.append(PRINT_FRAGMENT_TEMPLATE.format(
+                count=count,
+                type=enumType,
+                width="true" if width == '*' else "false",
+                precision="true" if precision == '*' else "false",
+                substring=substring
+            ))
             count += 1
 
-        dictionaryFragment += "}\r\n\r\n"
+        dictionaryFragment.append("}\r\n\r\n")
 
         # All the code has been generated,  save them in our data structure
         code = {
@@ -696,20 +715,210 @@ inline void
             "linenum"           : linenum,
             "logLevel"          : logLevel,
             "compilationUnit"   : compilationName,
-            "recordFnDef"       : recordCode,
-            "compressFnDef"     : compressionCode,
-            "decompressFnDef"   : decompressionCode,
+            "signature"         : signature,
+            "idVariableName"    : generateIdVariableNameFromLogId(logId),
             "recordFnName"      : recordFnName,
             "compressFnName"    : compressFnName,
             "decompressFnName"  : decompressFnName,
             "recordFnDecl"      : recordDeclaration,
-            "dictionaryFragment": dictionaryFragment
+            "dictionaryFragment": "".join(dictionaryFragment)
         }
 
         self.logId2Code[logId] = code
 
         return (recordDeclaration, recordFnName)
 
+# Generate the record, compress, and decompress function definitions shared
+# by all the NANO_LOG statements that take in the same arguments. The parts
+# specific to a single NANO_LOG statement are left as placeholders (${logId},
+# ${fmtString}, ${filename}, ${linenum}, and ${logLevel}) to be substituted in
+# by fillFunctionTemplate().
+#
+# \param argList
+#           List of C++ types for the arguments of the NANO_LOG statement
+# \param strlenDeclarations
+#           C++ statements that compute the lengths of the string arguments
+#
+# \return
+#           Dictionary containing the "recordFnDef", "compressFnDef", and
+#           "decompressFnDef" templates
+def generateFunctionTemplates(argList, strlenDeclarations):
+    functionParametersString = "".join([f", {type} arg{idx}"
+                                      for idx, type in enumerate(argList)])
+
+    ###
+    # Generate Record function
+    ###
+
+    # Create lists identifying which argument indexes are (not) strings
+    stringArgsIdx = [idx for idx, fmt in enumerate(argList)
+                                            if isStringType(fmt)]
+    nonStringArgsIdx = [idx for idx, fmt in enumerate(argList)
+                                            if not isStringType(fmt)]
+
+    # For these two partial sums, it must end in a '+' character. Also,
+    # for stringLenPartialSum, there's a +1 for a NULL character at the end
+    stringLenPartialSum = "".join([f"str{idx}Len + "
+                                  for idx in stringArgsIdx])
+
+    nonStringSizeOfPartialSum = "".join([f"sizeof(arg{idx}) + "
+                                      for idx in nonStringArgsIdx])
+
+    # Bytes needed to store the primitive byte lengths
+    numNibbles = len(nonStringArgsIdx)
+    nibbleByteSizes = (numNibbles + 1) // 2
+
+    recordNonStringArgsCode = "".join([
+            f"\t{RECORD_PRIMITIVE_FN}(buffer, arg{idx});\n"
+                                            for idx in nonStringArgsIdx])
+
+    recordStringsArgsCode = [f"memcpy(buffer, arg{idx}, str{idx}Len); "
+           f"buffer += str{idx}Len;"
+           f"*(reinterpret_cast<std::remove_const<typename std::remove_pointer<decltype(arg{idx})>::type>::type*>(buffer) - 1) = L'\\0';"
+                                           for idx in stringArgsIdx]
+
+    # Start Generating the record code
+    recordDeclaration = "void %s(%s level, const char* fmtStr %s)" % (
+            "__syang0__fl${logId}", LOG_LEVEL_ENUM, functionParametersString)
+    recordCode = RECORD_FN_TEMPLATE.format(
+        function_declaration = recordDeclaration,
+        getLogLevelFn=LOG_LEVEL_GET_FN,
+        strlen_declaration = "\r\n\t".join(strlenDeclarations),
+        primitive_size_sum = nonStringSizeOfPartialSum,
+        strlen_sum = stringLenPartialSum,
+        entry = RECORD_ENTRY,
+        alloc_fn = ALLOC_FN,
+        idVariableName = generateIdVariableNameFromLogId("${logId}"),
+        nibble_size = nibbleByteSizes,
+        recordNonStringArgsCode = recordNonStringArgsCode,
+        recordStringsArgsCode = "\r\n\t".join(recordStringsArgsCode),
+        finishAlloc_fn = FINISH_ALLOC_FN
+    )
+
+    ###
+    # Generate compression
+    ###
+
+    # Generate code to compress the arguments from a RecordEntry to
+    # an output array.
+
+    readBackNonStringArgsCode = []
+    for idx in nonStringArgsIdx:
+        type = argList[idx]
+        readBackNonStringArgsCode.append(
+                f"\t{type} arg{idx}; "
+                f"std::memcpy(&arg{idx}, args, sizeof({type})); "
+                f"args +=sizeof({type});\n")
+
+    packNonStringArgsCode = []
+    for i, idx in enumerate(nonStringArgsIdx):
+        mem = "first" if (i % 2 == 0) else "second"
+        packNonStringArgsCode.append(
+            f"\tnib[{i // 2}].{mem} = "
+            f"0x0f & static_cast<uint8_t>({PACK_FN}(&out, arg{idx}));\n")
+
+    compressionCode = COMPRESS_FN_TEMPLATE.format(
+        compressFnName="compressArgs${logId}",
+        Entry=RECORD_ENTRY,
+        Nibble=NIBBLE_OBJ,
+        nibbleBytes=nibbleByteSizes,
+        readBackNonStringArgsCode="".join(readBackNonStringArgsCode),
+        packNonStringArgsCode="".join(packNonStringArgsCode),
+        sizeofNonStringTypes=nonStringSizeOfPartialSum,
+        hasStrings=("true" if stringArgsIdx else "false")
+    )
+
+    ###
+    # Generate Decompression
+    ###
+
+    # Unpack all the non-string arguments with their nibbles
+    unpackNonStringArgsCode = []
+    for i, idx in enumerate(nonStringArgsIdx):
+        type = argList[idx]
+        member = "first" if (i%2 == 0) else "second"
+
+        unpackNonStringArgsCode.append(
+            f"\t{type} arg{idx} = {UNPACK_FN}<{type}>(in, nib[{i // 2}].{member});\n")
+
+    # Read back all the strings
+    readbackStringCode = []
+    for idx in stringArgsIdx:
+        type = argList[idx]
+
+        strlenFn = "strlen" if not isWideString(type) else "wcslen"
+        readbackStringCode.append(
+        """
+                {type} arg{idx} = reinterpret_cast<{type}>(*in);
+                (*in) += ({strlenFn}(arg{idx}) + 1)*sizeof(*arg{idx}); // +1 for null terminator
+            """.format(idx=idx, type=type, strlenFn=strlenFn))
+
+    decompressionCode = DECOMPRESS_FN_TEMPLATE.format(
+        decompressFnName="decompressPrintArgs${logId}",
+        Nibble=NIBBLE_OBJ,
+        nibbleBytes=nibbleByteSizes,
+        unpackNonStringArgsCode="".join(unpackNonStringArgsCode),
+        readbackStringCode="".join(readbackStringCode),
+        fmtString="${fmtString}",
+        filename="${filename}",
+        linenum="${linenum}",
+        logLevelEnum=LOG_LEVEL_ENUM,
+        logLevel="${logLevel}",
+        printfArgs="".join([f", arg{i}" for i in range(len(argList))])
+    )
+
+    return {
+        "recordFnDef"       : recordCode,
+        "compressFnDef"     : compressionCode,
+        "decompressFnDef"   : decompressionCode
+    }
+
+# Matches the ${name} placeholders left in the templates generated by
+# generateFunctionTemplates(). re.split() with this pattern yields a list with
+# the literal C++ code in the even slots and the placeholder names in the odd.
+FUNCTION_TEMPLATE_PLACEHOLDER_REGEX = re.compile(r"\$\{(\w+)\}")
+
+# Splits a function template generated by generateFunctionTemplates() around
+# its placeholders. The result is cached since a template is shared by every
+# NANO_LOG statement with the same signature, so it only needs to be split
+# once no matter how many statements are filled in with it.
+#
+# \param template
+#           Function template from generateFunctionTemplates()
+#
+# \return
+#           Tuple alternating between literal code and placeholder names
+@lru_cache(maxsize=None)
+def splitFunctionTemplate(template):
+    return tuple(FUNCTION_TEMPLATE_PLACEHOLDER_REGEX.split(template))
+
+# Fill in the NANO_LOG statement specific parts of a function template
+# generated by generateFunctionTemplates().
+#
+# \param template
+#           Function template from generateFunctionTemplates()
+# \param logId
+#           logId of the NANO_LOG statement as generated by generateLogIdStr()
+# \param code
+#           The NANO_LOG statement's entry in FunctionGenerator.logId2Code
+#
+# \return
+#           The complete C++ function definition
+def fillFunctionTemplate(template, logId, code):
+    values = {
+        "logId"     : logId,
+        "fmtString" : code["fmtString"],
+        "filename"  : code["filename"],
+        "linenum"   : str(code["linenum"]),
+        "logLevel"  : code["logLevel"]
+    }
+
+    pieces = list(splitFunctionTemplate(template))
+    for i in range(1, len(pieces), 2):
+        pieces[i] = values[pieces[i]]
+
+    return "".join(pieces)
+
 # Identifies a format specifier's C++ type and optional width/precision in a
 # format string. The width/precision could be None, a number, or '*' which
 # indicates a dynamic argument. The substring is the portion of the format
@@ -717,6 +926,131 @@ inline void
 # or beginning of the string.
 FmtType = namedtuple('FmtType', ['type', 'width', 'precision', 'substring'])
 
+# Canonical instances of every FmtType produced so far. Distinct format strings
+# frequently contain identical specifier pieces (i.e. "%d"), so parse results
+# share a single instance for equal FmtTypes rather than each holding its own.
+FMT_TYPE_INTERN = {}
+
+# Returns the canonical instance of an FmtType, registering it if it is new.
+def internFmtType(fmtType):
+    return FMT_TYPE_INTERN.setdefault(fmtType, fmtType)
+
+# Character classes for the components of a printf format specifier
+FMT_FLAG_CHARS = frozenset("-+ #0")
+FMT_DIGIT_CHARS = frozenset("0123456789")
+FMT_LENGTH_CHARS = frozenset("hljzZtL")
+FMT_SPECIFIER_CHARS = frozenset("diuoxXfFeEgGaAcspn")
+
+# Scans a single printf format specifier of the form
+# %[flags][width][.precision][length]specifier starting at the '%' character
+# at fmtString[start]. This walks the fixed grammar directly rather than going
+# through a regular expression since it runs for every specifier in every
+# format string and only needs a handful of character comparisons.
+#
+# \param fmtString
+#           Printf-like format string containing the specifier
+# \param start
+#           Index of the '%' that begins the specifier
+#
+# \return
+#           A (width, precision, length, specifier, end) tuple where the
+#           width/precision are None, a string of digits, or '*', the
+#           length is None or the length modifier, and end is the index
+#           just past the specifier. None is returned if there's no valid
+#           specifier at start.
+def scanFmtSpecifier(fmtString, start):
+    strLen = len(fmtString)
+    pos = start + 1
+    while pos < strLen and fmtString[pos] in FMT_FLAG_CHARS:
+        pos += 1
+
+    width = None
+    if pos < strLen and fmtString[pos] == '*':
+        width = '*'
+        pos += 1
+    else:
+        digitsStart = pos
+        while pos < strLen and fmtString[pos] in FMT_DIGIT_CHARS:
+            pos += 1
+        if pos > digitsStart:
+            width = fmtString[digitsStart:pos]
+
+    # The precision is only consumed if it's followed by digits or a '*'
+    precision = None
+    if pos < strLen and fmtString[pos] == '.':
+        if pos + 1 < strLen and fmtString[pos + 1] == '*':
+            precision = '*'
+            pos += 2
+        else:
+            digitsEnd = pos + 1
+            while digitsEnd < strLen and fmtString[digitsEnd] in FMT_DIGIT_CHARS:
+                digitsEnd += 1
+            if digitsEnd > pos + 1:
+                precision = fmtString[pos + 1:digitsEnd]
+                pos = digitsEnd
+
+    length = None
+    if pos < strLen and fmtString[pos] in FMT_LENGTH_CHARS:
+        length = fmtString[pos]
+        pos += 1
+        if length in "hl" and pos < strLen and fmtString[pos] == length:
+            length += length
+            pos += 1
+
+    if pos < strLen and fmtString[pos] in FMT_SPECIFIER_CHARS:
+        return (width, precision, length, fmtString[pos], pos + 1)
+
+    return None
+
+# Matches the only characters that change the state of the format string scan
+# in splitAndParseTypesInFmtString(): a "%" or an escaping backslash.
+FMT_SPECIAL_CHAR_REGEX = re.compile("[%\\\\]")
+
+# Builds the table mapping the (length, specifier) pair of every valid printf
+# format specifier to the C++ type of its argument. This follows the standard
+# according to the cplusplus reference
+# http://www.cplusplus.com/reference/cstdio/printf/ (9/7/16)
+#
+# \return
+#           Dictionary keyed by (length, specifier) where length is None if
+#           the format specifier has no length modifier
+def buildFmtTypeTable():
+    typeTable = {}
+
+    for specifier in "diuoxX":
+        unsigned = "unsigned " if specifier in "uoxX" else ""
+        typeTable.update({
+            (None, specifier): unsigned + "int",
+            ("hh", specifier): "unsigned char" if unsigned else "signed char",
+            ("h", specifier):  unsigned + "short int",
+            ("l", specifier):  unsigned + "long int",
+            ("ll", specifier): unsigned + "long long int",
+            # Special length modifiers here override the original signed-ness
+            ("j", specifier):  "uintmax_t" if unsigned else "intmax_t",
+            ("z", specifier):  "size_t",
+            ("Z", specifier):  "size_t",
+            ("t", specifier):  "ptrdiff_t"
+        })
+
+    # Doubles ignore all length modifiers except for 'L'
+    for specifier in "fFeEgGaA":
+        for length in (None, "hh", "h", "l", "ll", "j", "z", "Z", "t"):
+            typeTable[(length, specifier)] = "double"
+        typeTable[("L", specifier)] = "long double"
+
+    typeTable.update({
+        (None, "p"): "const void*",
+        (None, "s"): "const char*",
+        ("l", "s"):  "const wchar_t*",
+        (None, "c"): "int",
+        ("l", "c"):  "wint_t"
+    })
+
+    # Share a single instance of each type name across the table entries
+    return {key: sys.intern(type) for key, type in typeTable.items()}
+
+FMT_TYPE_TABLE = buildFmtTypeTable()
+
 # Given a C++ printf-like format string, split the string such that there's
 # a) At most one format specifier per substring and
 # b) Identify the C-type and width/precision associated w/ that format specifier
@@ -725,174 +1059,114 @@ FmtType = namedtuple('FmtType', ['type', 'width', 'precision', 'substring'])
 # Note that the "%n" specifier is not supported in the NanoLog system and
 # will cause the following function to throw a ValueError
 #
+# Results are memoized by fmtString since the same format string tends to
+# reappear in many log statements and the parse only depends on the string.
+#
 # \param fmtString
 #           Printf-like format string such as "number=%d, float=%0.2f"
 #
 # \return
-#           A list of FmtType named tuples indicating (C++ type, precision) Ex:
-#           [("int", None), ("const char*", "*"), ("const char*", "4"), ...]
+#           A tuple of FmtType named tuples indicating (C++ type, precision) Ex:
+#           (("int", None), ("const char*", "*"), ("const char*", "4"), ...)
 #           Note: a precision of '*' indicates previous element is precision
 #
 # \throws ValueError
 #           Thrown if the format string does not conform to standards
+@lru_cache(maxsize=None)
 def splitAndParseTypesInFmtString(fmtString):
     # This function follows the standard according to the cplusplus reference
     # http://www.cplusplus.com/reference/cstdio/printf/ (9/7/16)
 
-    # These are the set of characters that can serve as specifiers
-    signedSet = 'di'
-    unsignedSet = 'uoxX'
-    floatSet = 'fFeEgGaA'
-    integerSet = signedSet + unsignedSet
-
-    # The next while loop scans through the string looking for unescaped "%"
+    # The next while loop scans through the string looking for unescaped "%",
+    # jumping directly between the characters that affect the scan. Escapes
+    # ("\\x" and "%%") are consumed whole, so no other state is needed.
     matches = []
     charIndex = 0
-    consecutivePercents = 0
     startOfNextSpecifierSubstring = 0
-    while charIndex < len(fmtString):
-        c = fmtString[charIndex]
-
-        if c == "\\":
-            # Skip the next character if there's an escape
-            charIndex += 1
-        elif c == "%":
-            consecutivePercents += 1
-            if consecutivePercents % 2 == 1:
-                # At this point we should be at a %, so try to regex it
-                match = re.match("^%"
-                                 "(?P<flags>[-+ #0]+)?"
-                                 "(?P<width>[\\d]+|\\*)?"
-                                 "(\\.(?P<precision>\\d+|\\*))?"
-                                 "(?P<length>hh|h|l|ll|j|z|Z|t|L)?"
-                                 "(?P<specifier>[diuoxXfFeEgGaAcspn])",
-                                 fmtString[charIndex:])
-
-                if match:
-                    endPos = charIndex + len(match.group(0))
-                    substring = fmtString[startOfNextSpecifierSubstring:endPos]
-                    startOfNextSpecifierSubstring = endPos
-
-                    matches.append((match, substring))
-                elif not re.match("%%", fmtString[charIndex:]):
-                    raise ValueError("Unrecognized Format Specifier: \"%s\"" %
-                                        fmtString[charIndex:].split()[0])
-        else:
-            consecutivePercents = 0
-
-        charIndex += 1
+    while True:
+        special = FMT_SPECIAL_CHAR_REGEX.search(fmtString, charIndex)
+        if not special:
+            break
+
+        charIndex = special.start()
+        if fmtString[charIndex] == "\\" or \
+                fmtString.startswith("%%", charIndex):
+            charIndex += 2
+            continue
+
+        # At this point we should be at a %, so try to scan it
+        fields = scanFmtSpecifier(fmtString, charIndex)
+        if not fields:
+            raise ValueError("Unrecognized Format Specifier: \"%s\"" %
+                                fmtString[charIndex:].split(None, 1)[0])
+
+        specifierStart = charIndex
+        charIndex = fields[-1]
+        substring = fmtString[startOfNextSpecifierSubstring:charIndex]
+        startOfNextSpecifierSubstring = charIndex
+        matches.append((fields, specifierStart, substring))
 
     # Fold in the remainder of the format string into the last argument if it
     # exists; otherwise just return our format-less string
     if len(matches) > 0:
-        lastItem = matches.pop()
-        matches.append((lastItem[0],
-                        lastItem[1] + fmtString[startOfNextSpecifierSubstring:]))
+        fields, specifierStart, substring = matches.pop()
+        matches.append((fields, specifierStart,
+                        substring + fmtString[startOfNextSpecifierSubstring:]))
     else:
-        return [FmtType(None, None, None, fmtString)]
+        return (internFmtType(FmtType(None, None, None, fmtString)),)
 
     types = []
-    for (fmt, substring) in matches:
-        length = fmt.group('length')
-        specifier = fmt.group('specifier')
-        precision = fmt.group("precision")
+    for (fields, specifierStart, substring) in matches:
+        (width, precision, length, specifier, specifierEnd) = fields
         if precision and precision != '*':
-            precision = int(float(precision))
-        width = fmt.group('width')
+            precision = int(precision)
         if width and width != '*':
-            width = int(float(width))
-
-        # Handle the most common case of regular integer types first
-        if specifier in integerSet:
-            type = ""
-
-            if specifier in unsignedSet:
-                type += "unsigned "
-
-            if not length:
-                type += "int "
-            elif length == "hh":
-                type = "unsigned char" if type else "signed char"
-            elif length == "h":
-                type += "short int "
-            elif length == "l":
-                type += "long int"
-            elif length == "ll":
-                type += "long long int"
-            # Special length modifiers here override the original signed-ness
-            elif length == "j":
-                if specifier in signedSet:
-                    type = "intmax_t"
-                else:
-                    type = "uintmax_t"
-            elif length == "z" or length == "Z":
-                type = "size_t"
-            elif length == "t":
-                type = "ptrdiff_t"
-            else:
-                raise ValueError("Invalid arguments for format specifier "
-                                    + fmt.group())
+            width = int(width)
 
-            types.append(FmtType(type.strip(), width, precision, substring))
+        if specifier == "n":
+            raise ValueError("\"%n\" print specifier not supported in "
+                             + fmtString[specifierStart:specifierEnd])
 
-        # Next are doubles
-        elif specifier in floatSet:
-            if length == 'L':
-                types.append(FmtType("long double", width, precision, substring))
-            else:
-                types.append(FmtType("double", width, precision, substring))
+        type = FMT_TYPE_TABLE.get((length, specifier))
+        if not type:
+            raise ValueError("Invalid arguments for format specifier "
+                                + fmtString[specifierStart:specifierEnd])
 
-        # Finally the special cases
-        elif specifier == "p":
-            if not length:
-                types.append(FmtType("const void*", width, precision, substring))
-            else:
-                raise ValueError("Invalid arguments for format specifier "
-                                    + fmt.group())
-        elif specifier == "s":
-            if not length:
-                types.append(FmtType("const char*", width, precision, substring))
-            elif length == "l":
-                types.append(FmtType("const wchar_t*", width, precision, substring))
-            else:
-                raise ValueError("Invalid arguments for format specifier "
-                                    + fmt.group())
-        elif specifier == "c":
-            if not length:
-                types.append(FmtType("int", width, precision, substring))
-            elif length == "l":
-                types.append(FmtType("wint_t", width, precision, substring))
-            else:
-                raise ValueError("Invalid arguments for format specifier "
-                                 + fmt.group())
-        elif specifier == "n":
-            raise ValueError("\"%n\" print specifier not supported in "
-                             + fmt.group())
+        types.append(FmtType(type, width, precision, substring))
 
-    return types
+    return tuple(internFmtType(fmtType) for fmtType in types)
 
 # Given a C++ type (such as 'int') as identified by parseTypesInFmtString,
 # determine whether that type is a string or not.
 #
 # \param typeStr - Whether a FmtType is a string or not in C/C++ land
 def isStringType(typeStr):
-    return typeStr and (
-            -1 != typeStr.find("char*") or
-            -1 != typeStr.find("wchar_t*"))
+    return typeStr and ("char*" in typeStr or "wchar_t*" in typeStr)
 
 # Given a C++ type (such as 'int') as identified by parseTypesInFmtString,
 # determine whether that type is a wide string or not.
 #
 # \param typeStr - Whether a FmtType is a string or not in C/C++ land
 def isWideString(typeStr):
-    return typeStr and -1 != typeStr.find("wchar_t*")
+    return typeStr and "wchar_t*" in typeStr
 
 # Helper functions to generate variable names
 def generateIdVariableNameFromLogId(logId):
     return "__fmtId" + logId
 
-def generateLogIdStr(fmtString, filename, linenum):
-    def encode(string):
-        return "".join([c if c.isalnum() else str(ord(c)) for c in string])
+# str.translate() table used by generateLogIdStr() that keeps alphanumeric
+# characters as is and replaces every other character with its decimal code
+# point. Entries are computed on first use so any character can be encoded.
+class LogIdEncodeTable(dict):
+    def __missing__(self, codePoint):
+        char = chr(codePoint)
+        encoded = char if char.isalnum() else str(codePoint)
+        self[codePoint] = encoded
+        return encoded
 
-    return "__%s__%s__%d__" % (encode(fmtString), encode(filename), linenum)
+LOG_ID_ENCODE_TABLE = LogIdEncodeTable()
+
+def generateLogIdStr(fmtString, filename, linenum):
+    return "__%s__%s__%d__" % (fmtString.translate(LOG_ID_ENCODE_TABLE),
+                               filename.translate(LOG_ID_ENCODE_TABLE),
+                               linenum)
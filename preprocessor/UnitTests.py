@@ -275,19 +275,19 @@ class FunctionGeneratorTestCase(unittest.TestCase):
 
         # No replacements should be performed because all % are escaped
         self.assertEqual(splitAndParseTypesInFmtString(fmtString),
-                         [(None, None, None, fmtString)])
+                         ((None, None, None, fmtString),))
 
         fmtString = ""
         self.assertEqual(splitAndParseTypesInFmtString(fmtString),
-                         [(None, None, None, fmtString)])
+                         ((None, None, None, fmtString),))
 
         fmtString = "Hello"
         self.assertEqual(splitAndParseTypesInFmtString(fmtString),
-                         [(None, None, None, fmtString)])
+                         ((None, None, None, fmtString),))
 
         fmtString = "\% %%ud"
         self.assertEqual(splitAndParseTypesInFmtString(fmtString),
-                         [(None, None, None, fmtString)])
+                         ((None, None, None, fmtString),))
 
         # Invalid types
         fmtString = "%S %qosiwieud"
@@ -299,29 +299,29 @@ class FunctionGeneratorTestCase(unittest.TestCase):
         # Tricky
         fmtString = "\\%s %%p %%%s \\\\%s"
         self.assertEqual(splitAndParseTypesInFmtString(fmtString),
-                         [FmtType("const char*", None, None, '\\%s %%p %%%s'),
-                          FmtType("const char*", None, None, ' \\\\%s')])
+                         (FmtType("const char*", None, None, '\\%s %%p %%%s'),
+                          FmtType("const char*", None, None, ' \\\\%s')))
 
     def test_parseTypesInFmtString_endingStrings(self):
         self.assertEqual(splitAndParseTypesInFmtString("Hello"),
-                         [FmtType(None, None, None, "Hello")])
+                         (FmtType(None, None, None, "Hello"),))
 
         self.assertEqual(splitAndParseTypesInFmtString("Hello %d"),
-                         [FmtType('int', None, None, "Hello %d")])
+                         (FmtType('int', None, None, "Hello %d"),))
 
         self.assertEqual(splitAndParseTypesInFmtString("Hello %d Bye"),
-                         [FmtType('int', None, None, "Hello %d Bye")])
+                         (FmtType('int', None, None, "Hello %d Bye"),))
 
         self.assertEqual(splitAndParseTypesInFmtString("Hello %d Bye %s"),
-                         [FmtType('int', None, None, "Hello %d"),
-                          FmtType('const char*', None, None, " Bye %s")])
+                         (FmtType('int', None, None, "Hello %d"),
+                          FmtType('const char*', None, None, " Bye %s")))
 
     def test_parseTypesInFmtString_charTypes(self):
         self.assertEqual(splitAndParseTypesInFmtString("%hhd %hhi"),
-                         [FmtType("signed char", None, None, "%hhd"),
-                          FmtType("signed char", None, None, " %hhi")])
+                         (FmtType("signed char", None, None, "%hhd"),
+                          FmtType("signed char", None, None, " %hhi")))
         self.assertEqual(splitAndParseTypesInFmtString(" %d"),
-                         [FmtType("int", None, None, " %d")])
+                         (FmtType("int", None, None, " %d"),))
 
         with self.assertRaisesRegex(ValueError, "not supported"):
             splitAndParseTypesInFmtString("%hhn")
@@ -331,20 +331,20 @@ class FunctionGeneratorTestCase(unittest.TestCase):
 
     def test_parseTypesInFmtString_jzt(self):
         self.assertEqual(splitAndParseTypesInFmtString("%10.12jd %9ji"),
-                         [FmtType('intmax_t', 10, 12, '%10.12jd'),
-                          FmtType('intmax_t', 9, None, ' %9ji')])
+                         (FmtType('intmax_t', 10, 12, '%10.12jd'),
+                          FmtType('intmax_t', 9, None, ' %9ji')))
 
         self.assertEqual(splitAndParseTypesInFmtString("%0*.*ju %jo %jx %jX"),
-                         [FmtType("uintmax_t", '*', '*', '%0*.*ju'),
+                         (FmtType("uintmax_t", '*', '*', '%0*.*ju'),
                           FmtType("uintmax_t", None, None, " %jo"),
                           FmtType("uintmax_t", None, None, " %jx"),
-                          FmtType("uintmax_t", None, None, " %jX")])
+                          FmtType("uintmax_t", None, None, " %jX")))
 
         self.assertEqual(splitAndParseTypesInFmtString("%zu %zd %tu %td"),
-                         [FmtType("size_t", None, None, "%zu"),
+                         (FmtType("size_t", None, None, "%zu"),
                           FmtType("size_t", None, None, " %zd"),
                           FmtType('ptrdiff_t', None, None, " %tu"),
-                          FmtType("ptrdiff_t", None, None, " %td")])
+                          FmtType("ptrdiff_t", None, None, " %td")))
 
         with self.assertRaisesRegex(ValueError, "specifier not supported"):
             splitAndParseTypesInFmtString("%jn %zn zn %tn")
@@ -365,30 +365,30 @@ class FunctionGeneratorTestCase(unittest.TestCase):
     def test_parseTypesInFmtString_doubleTypes(self):
         self.assertEqual(splitAndParseTypesInFmtString(
             "%12.0f %12.3F %e %55.3E %-10.5g %G %a %A"),
-            [FmtType("double", 12, 0, "%12.0f"),
+            (FmtType("double", 12, 0, "%12.0f"),
              FmtType("double", 12, 3, " %12.3F"),
              FmtType("double", None, None, " %e"),
              FmtType("double", 55, 3, " %55.3E"),
              FmtType("double", 10, 5, " %-10.5g"),
              FmtType("double", None, None, " %G"),
              FmtType("double", None, None, " %a"),
-             FmtType("double", None, None, " %A")])
+             FmtType("double", None, None, " %A")))
 
         self.assertEqual(splitAndParseTypesInFmtString(
             "%12.0Lf %12.3LF %Le %55.3LE %-10.5Lg %LG %La %LA"),
-            [FmtType("long double", 12, 0, "%12.0Lf"),
+            (FmtType("long double", 12, 0, "%12.0Lf"),
              FmtType("long double", 12, 3, " %12.3LF"),
              FmtType("long double", None, None, " %Le"),
              FmtType("long double", 55, 3, " %55.3LE"),
              FmtType("long double", 10, 5, " %-10.5Lg"),
              FmtType("long double", None, None, " %LG"),
              FmtType("long double", None, None, " %La"),
-             FmtType("long double", None, None, " %LA")])
+             FmtType("long double", None, None, " %LA")))
 
         # Check that random modifiers don't change the type
         self.assertEqual(splitAndParseTypesInFmtString("%lf %llf"),
-                         [FmtType("double", None, None, "%lf"),
-                          FmtType("double", None, None, " %llf")])
+                         (FmtType("double", None, None, "%lf"),
+                          FmtType("double", None, None, " %llf")))
 
         # Check for errors
         with self.assertRaisesRegex(ValueError, "Invalid arguments for"):
@@ -396,70 +396,104 @@ class FunctionGeneratorTestCase(unittest.TestCase):
 
     def test_parseTypesInFmtString_basicIntegerTypes(self):
         self.assertEqual(splitAndParseTypesInFmtString("%d %i"),
-                         [FmtType("int", None, None, "%d"),
-                          FmtType("int", None, None, " %i")])
+                         (FmtType("int", None, None, "%d"),
+                          FmtType("int", None, None, " %i")))
         self.assertEqual(splitAndParseTypesInFmtString("%u %o"),
-                         [FmtType("unsigned int", None, None, "%u"),
-                          FmtType("unsigned int", None, None, " %o")])
+                         (FmtType("unsigned int", None, None, "%u"),
+                          FmtType("unsigned int", None, None, " %o")))
         self.assertEqual(splitAndParseTypesInFmtString("%x %X"),
-                         [FmtType("unsigned int", None, None, "%x"),
-                          FmtType("unsigned int", None, None, " %X")])
+                         (FmtType("unsigned int", None, None, "%x"),
+                          FmtType("unsigned int", None, None, " %X")))
 
         self.assertEqual(splitAndParseTypesInFmtString("%c %s %p"),
-                         [FmtType("int", None, None, "%c"),
+                         (FmtType("int", None, None, "%c"),
                           FmtType("const char*", None, None, " %s"),
-                          FmtType("const void*", None, None, " %p")])
+                          FmtType("const void*", None, None, " %p")))
 
         with self.assertRaisesRegex(ValueError, "specifier not supported"):
             splitAndParseTypesInFmtString("%n")
 
     def test_parseTypesInFmtString_cspn(self):
         self.assertEqual(splitAndParseTypesInFmtString("%c %s %p"),
-                         [FmtType("int", None, None, "%c"),
+                         (FmtType("int", None, None, "%c"),
                           FmtType("const char*", None, None, " %s"),
-                          FmtType("const void*", None, None, " %p")])
+                          FmtType("const void*", None, None, " %p")))
 
         self.assertEqual(splitAndParseTypesInFmtString("%ls %lc asdf"),
-                         [FmtType("const wchar_t*", None, None, "%ls"),
-                          FmtType("wint_t", None, None, " %lc asdf")])
+                         (FmtType("const wchar_t*", None, None, "%ls"),
+                          FmtType("wint_t", None, None, " %lc asdf")))
 
         with self.assertRaisesRegex(ValueError, "not supported"):
             splitAndParseTypesInFmtString("%n")
 
     def test_parseTypesInFmtString_precision(self):
         self.assertEqual(splitAndParseTypesInFmtString("%0.4d %0.2s %010.0s"),
-                         [FmtType('int', None, 4, "%0.4d"),
+                         (FmtType('int', None, 4, "%0.4d"),
                           FmtType('const char*', None, 2, " %0.2s"),
-                          FmtType('const char*', 10, 0, " %010.0s")])
+                          FmtType('const char*', 10, 0, " %010.0s")))
 
         self.assertEqual(splitAndParseTypesInFmtString("%*s %.*s %0*.*lf"),
-                         [ FmtType('const char*', '*', None, "%*s"),
+                         ( FmtType('const char*', '*', None, "%*s"),
                            FmtType('const char*', None, '*', " %.*s"),
                            FmtType('double', '*', '*', " %0*.*lf")
-                         ])
+                         ))
 
     def test_lengthModifiers(self):
         self.assertEqual(splitAndParseTypesInFmtString("%hhd %hd %ld %lld %jd %zd %09.2td"),
-                         [FmtType("signed char", None, None, "%hhd"),
+                         (FmtType("signed char", None, None, "%hhd"),
                           FmtType("short int",  None, None, " %hd"),
                           FmtType("long int", None, None, " %ld"),
                           FmtType("long long int",  None, None, " %lld"),
                           FmtType("intmax_t",  None, None, " %jd"),
                           FmtType("size_t", None, None, " %zd"),
-                          FmtType("ptrdiff_t", 9, 2, " %09.2td")])
+                          FmtType("ptrdiff_t", 9, 2, " %09.2td")))
 
         self.assertEqual(splitAndParseTypesInFmtString("%hhu %hu %lu %llu %ju %zu %09.2tu"),
-                         [FmtType("unsigned char", None, None, "%hhu"),
+                         (FmtType("unsigned char", None, None, "%hhu"),
                           FmtType("unsigned short int", None, None, " %hu"),
                           FmtType("unsigned long int", None, None, " %lu"),
                           FmtType('unsigned long long int', None, None, " %llu"),
                           FmtType("uintmax_t",  None, None, " %ju"),
                           FmtType("size_t", None, None, " %zu"),
-                          FmtType("ptrdiff_t", 9, 2, " %09.2tu")])
+                          FmtType("ptrdiff_t", 9, 2, " %09.2tu")))
 
         with self.assertRaisesRegex(ValueError, "specifier not supported"):
             splitAndParseTypesInFmtString("%hhn %hn %ln %lln %jn %zn %tn")
 
+    def test_scanFmtSpecifier(self):
+        self.assertEqual(scanFmtSpecifier("%d", 0), (None, None, None, "d", 2))
+        self.assertEqual(scanFmtSpecifier("a %-010.5lf b", 2),
+                         ("10", "5", "l", "f", 11))
+        self.assertEqual(scanFmtSpecifier("%*.*lls", 0),
+                         ("*", "*", "ll", "s", 7))
+        self.assertEqual(scanFmtSpecifier("%hhu", 0),
+                         (None, None, "hh", "u", 4))
+
+        # A '.' without digits is not a precision, so nothing matches
+        self.assertIsNone(scanFmtSpecifier("%.d", 0))
+        self.assertIsNone(scanFmtSpecifier("%lh", 0))
+        self.assertIsNone(scanFmtSpecifier("%5", 0))
+
+    def test_parseTypesInFmtString_memoized(self):
+        # Repeated format strings should share the same (immutable) result
+        first = splitAndParseTypesInFmtString("Memo %d %s")
+        second = splitAndParseTypesInFmtString("Memo %d %s")
+        self.assertIs(first, second)
+        self.assertIsInstance(first, tuple)
+
+        # Errors are not cached and are re-raised on every invocation
+        for i in range(2):
+            with self.assertRaisesRegex(ValueError, "not supported"):
+                splitAndParseTypesInFmtString("Memo %n")
+
+    def test_parseTypesInFmtString_interned(self):
+        # Equal specifiers from distinct format strings share one instance
+        first = splitAndParseTypesInFmtString("Intern %d %s")
+        second = splitAndParseTypesInFmtString("%d %s")
+        self.assertEqual(first[1], second[1])
+        self.assertIs(first[1], second[1])
+        self.assertIsNot(first[0], second[0])
+
     def test_generateLogFunctions_empty(self):
         self.maxDiff = None
         fg = FunctionGenerator()
@@ -543,6 +577,34 @@ class FunctionGeneratorTestCase(unittest.TestCase):
                           '__B__mar46cc__293__',
                           '__INVALID__INVALID__INVALID__'], ids)
 
+    def test_generateLogFunctions_sharedSignatures(self):
+        fg = FunctionGenerator()
+
+        fg.generateLogFunctions("DEBUG", "A %d %s", "mar.cc", "mar.cc", 293)
+        fg.generateLogFunctions("ERROR", "B $%d %s", "mar.cc", "mar.cc", 294)
+        fg.generateLogFunctions("DEBUG", "C %d %.*s", "s.cc", "s.cc", 100)
+
+        # The first two statements share a template, the third does not since
+        # it takes in an extra precision argument
+        idA = generateLogIdStr("A %d %s", "mar.cc", 293)
+        idB = generateLogIdStr("B $%d %s", "mar.cc", 294)
+        idC = generateLogIdStr("C %d %.*s", "s.cc", 100)
+        self.assertEqual(fg.logId2Code[idA]["signature"],
+                         fg.logId2Code[idB]["signature"])
+        self.assertNotEqual(fg.logId2Code[idA]["signature"],
+                            fg.logId2Code[idC]["signature"])
+        self.assertEqual(3, len(fg.signature2Template))
+
+        # Statement specific parts are filled back in when rendered
+        template = fg.signature2Template[fg.logId2Code[idB]["signature"]]
+        decompressFn = fillFunctionTemplate(template["decompressFnDef"],
+                                            idB, fg.logId2Code[idB])
+        self.assertIn("decompressPrintArgs" + idB, decompressFn)
+        self.assertIn("const char *fmtString = \"B $%d %s\";", decompressFn)
+        self.assertIn("const char *filename = \"mar.cc\";", decompressFn)
+        self.assertIn("const int linenum = 294;", decompressFn)
+        self.assertIn("logLevel = ERROR;", decompressFn)
+
     def test_getRecordFunctionDefinitionsFor(self):
         self.maxDiff = None
 
@@ -616,9 +678,32 @@ inline void __syang0__fl{logId}(NanoLog::LogLevel level, const char* fmtStr ) {{
             data = json.load(dataFile)
             self.assertEqual(fg.argLists2Cnt, data.get('argLists2Cnt'))
             self.assertEqual(fg.logId2Code, data.get('logId2Code'))
+            self.assertEqual(fg.signature2Template,
+                             data.get('signature2Template'))
 
         os.remove("test.json")
 
+    def test_outputMappingFile_pretty(self):
+        fg = FunctionGenerator()
+
+        fg.generateLogFunctions("DEBUG", "A", "mar.cc", "mar.cc", 293)
+        fg.generateLogFunctions("DEBUG", "D %d", "s.cc", "s.cc", 100)
+
+        # The pretty form holds the same data, just spread over more lines
+        fg.outputMappingFile("test.json")
+        fg.outputMappingFile("testPretty.json", pretty=True)
+        with open("test.json") as compactFile, \
+                open("testPretty.json") as prettyFile:
+            compact = compactFile.read()
+            pretty = prettyFile.read()
+
+            self.assertEqual(json.loads(compact), json.loads(pretty))
+            self.assertNotIn("\n", compact.strip())
+            self.assertIn("\n", pretty)
+
+        os.remove("test.json")
+        os.remove("testPretty.json")
+
     def test_outputMappingFile_withFolders(self):
         fg = FunctionGenerator()
 
@@ -639,6 +724,8 @@ inline void __syang0__fl{logId}(NanoLog::LogLevel level, const char* fmtStr ) {{
             data = json.load(dataFile)
             self.assertEqual(fg.argLists2Cnt, data.get('argLists2Cnt'))
             self.assertEqual(fg.logId2Code, data.get('logId2Code'))
+            self.assertEqual(fg.signature2Template,
+                             data.get('signature2Template'))
 
 
         os.remove("testFolder/test.json")
@@ -674,6 +761,41 @@ inline void __syang0__fl{logId}(NanoLog::LogLevel level, const char* fmtStr ) {{
         os.remove("map2.map")
         os.remove("test.h")
 
+    def test_generateLogIdStr(self):
+        self.assertEqual("__A3237d__mar46cc__293__",
+                         generateLogIdStr("A %d", "mar.cc", 293))
+
+        # Non-ASCII characters are encoded by their code points as well
+        self.assertEqual("__é32é__a47b__1__",
+                         generateLogIdStr("é é", "a/b", 1))
+        self.assertEqual("__é8212__12345__7__",
+                         generateLogIdStr("é—", "12345", 7))
+
+    def test_outputCompilationFiles_staleMap(self):
+        fg = FunctionGenerator()
+        fg.generateLogFunctions("DEBUG", "A %d", "mar.cc", "mar.cc", 293)
+        fg.outputMappingFile("map1.map")
+
+        # Older map files had complete functions per log statement and no
+        # shared templates; they should be rejected with a clear error
+        with open("map1.map") as mapFile:
+            data = json.load(mapFile)
+        del data["signature2Template"]
+        for code in data["logId2Code"].values():
+            del code["signature"]
+            del code["idVariableName"]
+        with open("map2.map", "w") as mapFile:
+            json.dump(data, mapFile)
+
+        with self.assertRaisesRegex(ValueError, "Stale map file \"map2.map\""):
+            FunctionGenerator.outputCompilationFiles("test.h",
+                                                     ["map1.map", "map2.map"])
+
+        os.remove("map1.map")
+        os.remove("map2.map")
+        if os.path.exists("test.h"):
+            os.remove("test.h")
+
     def test_isStringType(self):
         self.assertTrue(isStringType("char*"))
         self.assertTrue(isStringType("wchar_t*"))
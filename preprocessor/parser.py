@@ -1,4 +1,4 @@
-#! /usr/bin/python
+#! /usr/bin/env python3
 
 # Copyright (c) 2016-2017 Stanford University
 #
@@ -36,7 +36,7 @@ mode. This will aggregate all the log metadata in the map files and produce
 a supporting C++ header file used in the Runtime and Decompression components.
 
 Usage:
-    parser.py [-h] --mapOutput=MAP PREPROCESSED_SRC
+    parser.py [-h] [--pretty] --mapOutput=MAP PREPROCESSED_SRC
     parser.py [-h] --combinedOutput=HEADER [MAP_FILES...]
 
 Options:
@@ -46,6 +46,9 @@ Options:
                         file to be used in the combinedOutput mode. There should
                         be one map file per preprocessed_src
 
+  --pretty              Indent the map file so that it's human readable rather
+                        than compact
+
   PREPROCESSED_SRC      GNU-preprocessed C/C++ file to process. The processed
                         files will be outputted with an extra "i" extension
                         (ex test.i ->test.ii), will contain injected code,
@@ -91,6 +94,10 @@ ignored_files = set([
 # End library implementer parameters
 ####
 
+# Matches the line markers that the GNU preprocessor leaves in its output,
+# which have the form '# lineNumber "filename" flags'
+DIRECTIVE_REGEX = re.compile(r'^# (\d+) "(.*)"(.*)')
+
 # Simple structure to identify a position within a file via a line number
 # and an offset on that line
 FilePosition = namedtuple('FilePosition', ['lineNum', 'offset'])
@@ -271,18 +278,6 @@ def parseLogStatement(lines, startPosition):
 
   return logStatement
 
-# Helper function to peekNextMeaningfulCharacter that determines whether
-# a character is a printable character (like a-z) vs. a control code
-#
-# \param c - character to test
-# \param codec - character type (optional)
-#
-# \return - true if printable, false if not
-def isprintable(c, codec='utf8'):
-  try: c.decode(codec)
-  except UnicodeDecodeError: return False
-  else: return True
-
 # Given a start FilePosition, find the next valid character that is
 # syntactically important for the C/C++ program and return both the character
 # and FilePosition of that character.
@@ -320,9 +315,11 @@ def peekNextMeaningfulChar(lines, filePos):
 # \param inputFiles
 #           list of g++ preprocessed C/C++ files to analyze
 #
-def processFile(inputFile, mapOutputFilename):
+# \param prettyMap
+#           whether the intermediate map file should be human readable
+#
+def processFile(inputFile, mapOutputFilename, prettyMap=False):
   functionGenerator = FunctionGenerator()
-  directiveRegex = re.compile("^# (\d+) \"(.*)\"(.*)")
 
   with open(inputFile) as f, open(inputFile + "i", 'w') as output:
     try:
@@ -359,7 +356,7 @@ def processFile(inputFile, mapOutputFilename):
         # Parse special preprocessor directives that follows the format
         # '# lineNumber "filename" flags'
         if line[0] == "#":
-          directive = directiveRegex.match(line)
+          directive = DIRECTIVE_REGEX.match(line)
           if directive:
               # -1 since the line num describes the line after it, not the
               # current one, so we decrement it here before looping
@@ -572,15 +569,20 @@ def processFile(inputFile, mapOutputFilename):
       output.write(line)
 
     output.close()
-    functionGenerator.outputMappingFile(mapOutputFilename)
+    functionGenerator.outputMappingFile(mapOutputFilename, pretty=prettyMap)
 
 if __name__ == "__main__":
   arguments = docopt(__doc__, version='NanoLog Preprocesor v1.0')
 
   if arguments['--mapOutput']:
     processFile(inputFile=arguments['PREPROCESSED_SRC'],
-                mapOutputFilename=arguments['--mapOutput'])
+                mapOutputFilename=arguments['--mapOutput'],
+                prettyMap=arguments['--pretty'])
   else:
-    FunctionGenerator.outputCompilationFiles(
+    try:
+      FunctionGenerator.outputCompilationFiles(
                                   outputFileName=arguments['--combinedOutput'],
                                   inputFiles=arguments['MAP_FILES'])
+    except ValueError as e:
+      print("\r\nError - %s\r\n" % e.args[0])
+      sys.exit(1)